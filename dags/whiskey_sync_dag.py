@@ -4,25 +4,48 @@ Automates the complete workflow: Google Sheets → PostgreSQL → TypeScript →
 """
 
 from datetime import datetime, timedelta
+import hashlib
 import subprocess
 import os
+import sys
 from pathlib import Path
 
 from airflow import DAG
-from airflow.operators.bash import BashOperator
-from airflow.operators.python import ShortCircuitOperator
+from airflow.decorators import task, task_group
+from airflow.exceptions import AirflowException
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 # Look for .env in the parent directory of the dags folder
-env_path = Path(__file__).parent.parent / '.env'
-load_dotenv(env_path)
+# Skipped in the docker-compose setup, which already sets AIRFLOW__CORE__EXECUTOR
+# and loads .env through env_file, so DAG parsing doesn't re-read it every loop
+if 'AIRFLOW__CORE__EXECUTOR' not in os.environ:
+    env_path = Path(__file__).parent.parent / '.env'
+    load_dotenv(env_path)
 
 # Project paths (from environment variables)
 LIQUOR_APP_PATH = os.getenv('LIQUOR_APP_PATH', '/Users/jonny/Projects/liquor_app')
 CATALOG_BETA_PATH = os.getenv('CATALOG_BETA_PATH', '/Users/jonny/Projects/catalog-beta')
 DATA_FILE_PATH = 'src/data/whiskey-data.ts'
 
+# Sync scripts mounted into the Airflow containers; imported inside tasks so
+# DAG parsing does not pull in psycopg2
+SCRIPTS_PATH = os.getenv('LIQUOR_SCRIPTS_PATH', '/opt/airflow/scripts')
+if SCRIPTS_PATH not in sys.path:
+    sys.path.append(SCRIPTS_PATH)
+
+# Where the downloaded sheet is handed from the download task to the load task
+SHEET_CSV_PATH = os.getenv('SHEET_CSV_PATH', '/tmp/whiskey-sheet.csv')
+# Hash of the last sheet that was fully loaded and exported
+SHEET_HASH_PATH = SHEET_CSV_PATH + '.hash'
+
+# Columns the sync writes to; checked before loading
+LIQUOR_COLUMNS = (
+    'name', 'count', 'country_of_origin', 'category_style', 'region',
+    'distillery', 'age', 'purchased_approx', 'abv', 'volume', 'price_cost',
+    'opened_closed', 'errata', 'replacement_cost',
+)
+
 # Git environment variables for commit attribution (from .env)
 GIT_ENV = {
     'GIT_AUTHOR_NAME': os.getenv('GIT_AUTHOR_NAME', 'Airflow'),
@@ -33,6 +56,83 @@ GIT_ENV = {
     'PATH': '/opt/homebrew/bin:/usr/local/bin:' + os.environ.get('PATH', ''),
 }
 
+# Branch pushed to the remote after committing
+GIT_REMOTE = 'origin'
+GIT_PUSH_BRANCH = 'test-airflow-sync-2'
+
+# Commit and push in-process with pygit2 by default. Set GIT_USE_CLI=true to
+# fall back to the git command line, which also runs catalog-beta's git hooks.
+GIT_USE_CLI = os.getenv('GIT_USE_CLI', 'false').lower() == 'true'
+GIT_SSH_KEY = os.getenv('GIT_SSH_KEY', str(Path.home() / '.ssh' / 'id_ed25519'))
+
+def commit_and_push_with_pygit2(message):
+    """Commit the data file if it changed and push the branch using pygit2"""
+    import pygit2
+    from pygit2.enums import FileStatus
+
+    repo = pygit2.Repository(CATALOG_BETA_PATH)
+
+    # Same check as `git diff --quiet`: the working tree differs from the index
+    if repo.status_file(DATA_FILE_PATH) & FileStatus.WT_MODIFIED:
+        repo.index.add(DATA_FILE_PATH)
+        repo.index.write()
+        tree = repo.index.write_tree()
+        author = pygit2.Signature(GIT_ENV['GIT_AUTHOR_NAME'], GIT_ENV['GIT_AUTHOR_EMAIL'])
+        committer = pygit2.Signature(GIT_ENV['GIT_COMMITTER_NAME'], GIT_ENV['GIT_COMMITTER_EMAIL'])
+        repo.create_commit('HEAD', author, committer, message, tree, [repo.head.target])
+        print(f"✓ Committed changes in {DATA_FILE_PATH}")
+    else:
+        print(f"✗ No changes in {DATA_FILE_PATH}")
+
+    # Push whenever the branch is ahead of the remote, so a retry after a
+    # failed push still pushes the commit made by the earlier attempt
+    local = repo.references.get(f'refs/heads/{GIT_PUSH_BRANCH}')
+    remote = repo.references.get(f'refs/remotes/{GIT_REMOTE}/{GIT_PUSH_BRANCH}')
+    if local is None or (remote is not None and local.target == remote.target):
+        print("✗ Nothing to push")
+        return False
+
+    class PushCallbacks(pygit2.RemoteCallbacks):
+        def push_update_reference(self, refname, message):
+            # libgit2 reports refs the server refused here instead of raising
+            if message:
+                raise AirflowException(f"Push of {refname} was rejected: {message}")
+
+    credentials = pygit2.Keypair('git', f'{GIT_SSH_KEY}.pub', GIT_SSH_KEY, '')
+    repo.remotes[GIT_REMOTE].push(
+        [f'refs/heads/{GIT_PUSH_BRANCH}'],
+        callbacks=PushCallbacks(credentials=credentials),
+    )
+    print(f"✓ Pushed {GIT_PUSH_BRANCH} to {GIT_REMOTE}")
+    return True
+
+def commit_and_push_with_cli(message):
+    """Commit the data file if it changed and push the branch using git"""
+    env = {**os.environ, **GIT_ENV}
+
+    def git(*args, check=True):
+        # stdout is captured for rev-parse; errors and hook output go to the task log
+        return subprocess.run(['git', *args], cwd=CATALOG_BETA_PATH, env=env,
+                              stdout=subprocess.PIPE, text=True, check=check)
+
+    # git diff --quiet returns 0 if no changes, 1 if changes exist
+    if git('diff', '--quiet', DATA_FILE_PATH, check=False).returncode != 0:
+        git('add', DATA_FILE_PATH)
+        print(git('commit', '-m', message).stdout)
+        print(f"✓ Committed changes in {DATA_FILE_PATH}")
+    else:
+        print(f"✗ No changes in {DATA_FILE_PATH}")
+
+    local = git('rev-parse', f'refs/heads/{GIT_PUSH_BRANCH}', check=False).stdout.strip()
+    remote = git('rev-parse', f'refs/remotes/{GIT_REMOTE}/{GIT_PUSH_BRANCH}', check=False).stdout.strip()
+    if not local or local == remote:
+        print("✗ Nothing to push")
+        return False
+
+    git('push', GIT_REMOTE, GIT_PUSH_BRANCH)
+    print(f"✓ Pushed {GIT_PUSH_BRANCH} to {GIT_REMOTE}")
+    return True
+
 # DAG default arguments
 default_args = {
     'owner': os.getenv('AIRFLOW_DAG_OWNER', 'airflow'),
@@ -51,68 +151,107 @@ with DAG(
     schedule=None,  # Manual trigger only
     start_date=datetime(2026, 1, 1),  # Fixed start date
     catchup=False,
+    # Runs share the sheet CSV, ETag and hash files under SHEET_CSV_PATH
+    max_active_runs=1,
     tags=['whiskey', 'data-sync', 'manual'],
 ) as dag:
 
-    # Task 1: Download from Google Sheets and sync to PostgreSQL
-    # Runs in the Airflow container using mounted scripts
-    sync_to_database = BashOperator(
-        task_id='sync_google_sheets_to_postgres',
-        bash_command='python3 /opt/airflow/scripts/sync_from_sheets.py',
-    )
+    # Task 1: Download the sheet and skip the rest of the run if it is
+    # byte-identical to the last sheet that was synced
+    @task.short_circuit(task_id='download_google_sheet')
+    def download_sheet():
+        """
+        Returns the sheet's content hash if it changed, False otherwise.
+        """
+        import download_from_sheets
 
-    # Task 2: Export PostgreSQL to TypeScript
-    # Runs in the Airflow container using mounted scripts
-    export_to_typescript = BashOperator(
-        task_id='export_postgres_to_typescript',
-        bash_command='python3 /opt/airflow/scripts/export_to_typescript.py',
-    )
+        if not download_from_sheets.download_google_sheet_as_csv(SHEET_CSV_PATH):
+            raise AirflowException("Could not download from Google Sheets")
+
+        with open(SHEET_CSV_PATH, 'rb') as f:
+            sheet_hash = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+
+        try:
+            with open(SHEET_HASH_PATH, 'r') as f:
+                last_hash = f.read().strip()
+        except FileNotFoundError:
+            last_hash = None
+
+        if sheet_hash == last_hash:
+            print(f"✗ Sheet unchanged since last sync ({sheet_hash}), skipping")
+            return False
+
+        print(f"✓ Sheet changed ({sheet_hash})")
+        return sheet_hash
+
+    # Task 2: Check the database and catalog-beta while the download runs
+    @task_group(group_id='validate_schema')
+    def validate_schema():
+
+        @task(task_id='check_database_schema')
+        def check_database_schema():
+            from db import get_connection
+
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    "SELECT column_name FROM information_schema.columns "
+                    "WHERE table_schema = current_schema() AND table_name = 'liquor'"
+                )
+                columns = {row[0] for row in cur.fetchall()}
+
+            missing = [column for column in LIQUOR_COLUMNS if column not in columns]
+            if missing:
+                raise AirflowException(f"liquor table is missing columns: {', '.join(missing)}")
+            print("✓ liquor table schema is up to date")
 
-    # Task 3: Check if git changes exist (idempotency check)
-    def check_git_changes():
+        @task(task_id='check_catalog_beta')
+        def check_catalog_beta():
+            data_dir = (Path(CATALOG_BETA_PATH) / DATA_FILE_PATH).parent
+            if not (Path(CATALOG_BETA_PATH) / '.git').exists():
+                raise AirflowException(f"{CATALOG_BETA_PATH} is not a git repository")
+            if not data_dir.is_dir():
+                raise AirflowException(f"Missing export directory: {data_dir}")
+            print(f"✓ catalog-beta found at {CATALOG_BETA_PATH}")
+
+        check_database_schema()
+        check_catalog_beta()
+
+    # Task 3: Load the downloaded CSV into PostgreSQL and export it to TypeScript
+    # Both steps run in-process in one worker and share the pooled connection
+    @task(task_id='sync_and_export')
+    def sync_and_export():
+        import export_to_typescript
+        import sync_from_sheets
+
+        with open(SHEET_CSV_PATH, 'r', encoding='utf-8') as f:
+            if not sync_from_sheets.sync_to_database(f):
+                raise AirflowException("Could not update database")
+
+        if not export_to_typescript.export_to_typescript():
+            raise AirflowException("Could not export TypeScript file")
+
+    # Task 4: Commit and push the TypeScript file if it changed
+    # Skips the commit when the data hasn't changed (idempotency check)
+    @task(task_id='commit_and_push_changes')
+    def commit_and_push():
         """
-        Returns True if changes exist, False if no changes.
-        This prevents empty commits when data hasn't changed.
+        Returns True if a commit was pushed, False if there was nothing to push.
         """
-        result = subprocess.run(
-            ['git', 'diff', '--quiet', DATA_FILE_PATH],
-            cwd=CATALOG_BETA_PATH,
-            capture_output=True
-        )
-        # git diff --quiet returns 0 if no changes, 1 if changes exist
-        has_changes = result.returncode != 0
-
-        if has_changes:
-            print(f"✓ Git changes detected in {DATA_FILE_PATH}")
-        else:
-            print(f"✗ No changes in {DATA_FILE_PATH}, skipping commit/push")
-
-        return has_changes
-
-    check_changes = ShortCircuitOperator(
-        task_id='check_for_git_changes',
-        python_callable=check_git_changes,
-        ignore_downstream_trigger_rules=False,
-    )
-
-    # Task 4: Git add and commit
-    git_commit = BashOperator(
-        task_id='git_commit_changes',
-        bash_command=f'''
-            cd {CATALOG_BETA_PATH} && \\
-            git add {DATA_FILE_PATH} && \\
-            git commit -m "chore: sync whiskey data from Google Sheets [$(date +%Y-%m-%d)]"
-        ''',
-        env={**os.environ.copy(), **GIT_ENV},
-        cwd=CATALOG_BETA_PATH,
-    )
+        message = f"chore: sync whiskey data from Google Sheets [{datetime.now():%Y-%m-%d}]"
+        if GIT_USE_CLI:
+            return commit_and_push_with_cli(message)
+        return commit_and_push_with_pygit2(message)
 
-    # Task 5: Git push to remote
-    git_push = BashOperator(
-        task_id='git_push_to_remote',
-        bash_command=f'cd {CATALOG_BETA_PATH} && git push origin test-airflow-sync-2',
-        cwd=CATALOG_BETA_PATH,
-    )
+    # Task 5: Remember the synced sheet so identical downloads are skipped
+    # Runs last, so a run whose commit or push failed is retried in full
+    @task(task_id='record_sheet_hash')
+    def record_sheet_hash(sheet_hash):
+        with open(SHEET_HASH_PATH, 'w') as f:
+            f.write(sheet_hash)
 
     # Define task dependencies
-    sync_to_database >> export_to_typescript >> check_changes >> git_commit >> git_push
+    # The download and the schema checks run in parallel before the load
+    sheet_hash = download_sheet()
+    synced = sync_and_export()
+    [sheet_hash, validate_schema()] >> synced
+    synced >> commit_and_push() >> record_sheet_hash(sheet_hash)
@@ -0,0 +1,49 @@
+"""
+Shared PostgreSQL connection pool for the liquor scripts
+Lets the sync and export steps reuse one connection when they run in the
+same process (e.g. inside an Airflow worker)
+"""
+
+import os
+from contextlib import contextmanager
+
+from psycopg2.pool import ThreadedConnectionPool
+
+# Database configuration
+DB_CONFIG = {
+    'dbname': os.environ.get('DB_NAME', 'liquor_db'),
+    'user': os.environ.get('DB_USER', 'jonny'),
+    'password': os.environ.get('DB_PASSWORD', ''),
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'port': os.environ.get('DB_PORT', '5432'),
+    'application_name': 'whiskey_sync'
+}
+
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 4
+
+_pool = None
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ThreadedConnectionPool(POOL_MIN_CONNECTIONS, POOL_MAX_CONNECTIONS, **DB_CONFIG)
+    return _pool
+
+@contextmanager
+def get_connection():
+    """Borrow a connection from the pool and hand it back afterwards
+
+    The pool hands out the most recently returned connection first. Any
+    transaction left open (including after an error) is rolled back before
+    the connection goes back to the pool; callers commit their own work.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        if not conn.closed:
+            conn.rollback()
+        pool.putconn(conn, close=bool(conn.closed))
@@ -3,6 +3,8 @@
 Download liquor data from Google Sheets as CSV
 """
 
+import gzip
+import shutil
 import urllib.request
 import urllib.error
 import os
@@ -13,8 +15,38 @@ SPREADSHEET_ID = '1plsSjVwRABsIbpjZGsxBXWpLV4hAGPRTFFlJOV4guFk'
 SHEET_ID = '0'  # gid from the URL
 OUTPUT_FILE = 'Liquor - Sheet1.csv'
 
-def download_google_sheet_as_csv():
-    """Download Google Sheet as CSV using export URL"""
+# Chunk size used when streaming the download to disk
+COPY_CHUNK_SIZE = 64 * 1024
+
+def count_lines(path):
+    """Count lines in a file by scanning its bytes for newlines"""
+    line_count = 0
+    last_chunk = b''
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            line_count += chunk.count(b'\n')
+            last_chunk = chunk
+
+    # A last line without a trailing newline still counts
+    if last_chunk and not last_chunk.endswith(b'\n'):
+        line_count += 1
+    return line_count
+
+def read_etag(etag_file):
+    """Return the ETag saved by the last download, or None"""
+    try:
+        with open(etag_file, 'r') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def download_google_sheet_as_csv(output_file=OUTPUT_FILE):
+    """Download Google Sheet as CSV using export URL
+
+    Sends the ETag from the last download (kept next to the CSV as
+    `<output_file>.etag`) so an unchanged sheet returns 304 Not Modified
+    and the existing file is kept as-is.
+    """
 
     # Construct the CSV export URL
     # Format: https://docs.google.com/spreadsheets/d/{SPREADSHEET_ID}/export?format=csv&gid={SHEET_ID}
@@ -24,30 +56,52 @@ def download_google_sheet_as_csv():
     print(f"Spreadsheet ID: {SPREADSHEET_ID}")
     print(f"Sheet ID: {SHEET_ID}")
 
+    etag_file = f"{output_file}.etag"
+    headers = {'Accept-Encoding': 'gzip'}
+
+    # Only ask for a conditional download if we still have the file it refers to
+    etag = read_etag(etag_file) if os.path.exists(output_file) else None
+    if etag:
+        headers['If-None-Match'] = etag
+
     try:
-        # Download the CSV
-        with urllib.request.urlopen(url) as response:
-            csv_data = response.read()
+        # Download the CSV, streaming it to a temporary file in chunks rather
+        # than holding the whole body in memory, then swap it into place
+        tmp_file = f"{output_file}.tmp"
+        request = urllib.request.Request(url, headers=headers)
+        with urllib.request.urlopen(request) as response, open(tmp_file, 'wb') as f:
+            source = response
+            if response.headers.get('Content-Encoding') == 'gzip':
+                source = gzip.GzipFile(fileobj=response)
+            shutil.copyfileobj(source, f, COPY_CHUNK_SIZE)
+            new_etag = response.headers.get('ETag')
 
-        # Save to file
-        with open(OUTPUT_FILE, 'wb') as f:
-            f.write(csv_data)
+        os.replace(tmp_file, output_file)
 
         # Get file size
-        file_size = os.path.getsize(OUTPUT_FILE)
+        file_size = os.path.getsize(output_file)
 
         # Count lines
-        with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
-            line_count = sum(1 for _ in f) - 1  # Subtract header row
+        line_count = count_lines(output_file) - 1  # Subtract header row
+
+        # Remember the ETag only once the file is fully written
+        if new_etag:
+            with open(etag_file, 'w') as f:
+                f.write(new_etag)
+        elif os.path.exists(etag_file):
+            os.remove(etag_file)
 
-        print(f"✓ Successfully downloaded {OUTPUT_FILE}")
+        print(f"✓ Successfully downloaded {output_file}")
         print(f"  File size: {file_size:,} bytes")
         print(f"  Records: {line_count:,}")
 
         return True
 
     except urllib.error.HTTPError as e:
-        if e.code == 404:
+        if e.code == 304:
+            print(f"✓ Sheet not modified since last download, keeping {output_file}")
+            return True
+        elif e.code == 404:
             print(f"Error: Spreadsheet not found or not publicly accessible")
             print(f"Make sure the spreadsheet is shared with 'Anyone with the link can view'")
         else:
@@ -5,18 +5,11 @@ Generates the whiskey-data.ts file for the Next.js catalog app
 """
 
 import psycopg2
+import psycopg2.extras
 import os
-import json
-from datetime import date
-
-# Database configuration
-DB_CONFIG = {
-    'dbname': os.environ.get('DB_NAME', 'liquor_db'),
-    'user': os.environ.get('DB_USER', 'jonny'),
-    'password': os.environ.get('DB_PASSWORD', ''),
-    'host': os.environ.get('DB_HOST', 'localhost'),
-    'port': os.environ.get('DB_PORT', '5432')
-}
+import orjson
+
+from db import get_connection
 
 # Output file path
 # When running in Docker, /catalog-beta is mounted
@@ -26,28 +19,8 @@ if os.path.exists('/catalog-beta'):
 else:
     OUTPUT_FILE = '../../catalog-beta/src/data/whiskey-data.ts'
 
-def format_value(value, field_type='string'):
-    """Format a value for TypeScript output"""
-    if value is None:
-        if field_type == 'string':
-            return '""'
-        elif field_type == 'number':
-            return '0'
-        else:
-            return 'null'
-
-    if field_type == 'string':
-        # Escape quotes and backslashes
-        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"')
-        return f'"{escaped}"'
-    elif field_type == 'number':
-        return str(value)
-    elif field_type == 'date':
-        if isinstance(value, date):
-            return f'"{value.strftime("%-m/%-d/%Y")}"'
-        return f'"{value}"'
-
-    return str(value)
+# Rows fetched per round-trip from the server-side cursor
+EXPORT_BATCH_SIZE = 2000
 
 def export_to_typescript():
     """Export database to TypeScript file"""
@@ -58,98 +31,84 @@ def export_to_typescript():
 
     try:
         print("\nStep 1: Connecting to database...")
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-
-        print("Step 2: Querying data...")
-        cur.execute("""
-            SELECT
-                name,
-                count,
-                country_of_origin,
-                category_style,
-                region,
-                distillery,
-                age,
-                purchased_approx,
-                abv,
-                volume,
-                price_cost,
-                opened_closed,
-                errata,
-                replacement_cost
-            FROM liquor
-            ORDER BY name
-        """)
-
-        rows = cur.fetchall()
-        print(f"Found {len(rows):,} records")
-
-        print("\nStep 3: Generating TypeScript file...")
-
-        # Build TypeScript content
-        ts_content = """import { WhiskeyBottle } from '@/types/whiskey';
-
-export const whiskeyCollection: WhiskeyBottle[] = [
-"""
-
-        for i, row in enumerate(rows):
-            (name, count, country, type_, region, distillery, age,
-             purchase_date, abv, volume, price_cost, status, errata,
-             replacement_cost) = row
-
-            # Set defaults for missing values
-            quantity = count if count is not None else 1
-            purchase_price = price_cost if price_cost is not None else 0
-            current_value = replacement_cost if replacement_cost is not None else purchase_price
-
-            # Build the object
-            ts_content += "  {\n"
-            ts_content += f"    name: {format_value(name, 'string')},\n"
-            ts_content += f"    quantity: {quantity},\n"
-            ts_content += f"    country: {format_value(country, 'string')},\n"
-            ts_content += f"    type: {format_value(type_, 'string')},\n"
-            ts_content += f"    region: {format_value(region, 'string')},\n"
-            ts_content += f"    distillery: {format_value(distillery, 'string')},\n"
-            ts_content += f"    age: {format_value(age, 'string')},\n"
-            ts_content += f"    purchaseDate: {format_value(purchase_date, 'date')},\n"
-            ts_content += f"    abv: {format_value(abv, 'number')},\n"
-            ts_content += f"    size: {format_value(volume, 'string')},\n"
-            ts_content += f"    purchasePrice: {format_value(purchase_price, 'number')},\n"
-            ts_content += f"    status: {format_value(status, 'string')},\n"
-            ts_content += f"    batch: {format_value(errata, 'string')},\n"
-            ts_content += f"    notes: \"\",\n"
-            ts_content += f"    currentValue: {format_value(current_value, 'number')}"
-
-            # Add replacementCost if it exists
-            if replacement_cost is not None:
-                ts_content += f",\n    replacementCost: {format_value(replacement_cost, 'number')}"
-
-            ts_content += "\n  }"
-
-            # Add comma if not last item
-            if i < len(rows) - 1:
-                ts_content += ","
-
-            ts_content += "\n"
-
-        ts_content += "];\n"
-
-        # Write to file
-        # If OUTPUT_FILE is absolute, use it directly; otherwise make it relative to script dir
-        if os.path.isabs(OUTPUT_FILE):
-            output_path = OUTPUT_FILE
-        else:
-            output_path = os.path.join(os.path.dirname(__file__), OUTPUT_FILE)
-
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(ts_content)
-
-        print(f"\n✓ Successfully exported to {OUTPUT_FILE}")
-        print(f"  Total records: {len(rows):,}")
-
-        cur.close()
-        conn.close()
+        # A named (server-side) cursor streams rows in batches instead of
+        # loading the whole table into memory
+        with get_connection() as conn, conn.cursor(name='export_cur') as cur:
+            cur.itersize = EXPORT_BATCH_SIZE
+
+            # Decode json results with orjson instead of the stdlib parser
+            psycopg2.extras.register_default_json(conn_or_curs=cur, loads=orjson.loads)
+
+            print("Step 2: Querying data...")
+
+            # Each row comes back as one JSON object, with column mapping,
+            # defaults and date formatting done server-side. ORDER BY name keeps
+            # the generated file's git diffs stable. The unique idx_liquor_name
+            # index lets the server return rows already in that order, and
+            # sorting here instead would mean buffering the whole stream
+            cur.execute("""
+                SELECT json_build_object(
+                    'name', name,
+                    'quantity', COALESCE(count, 1),
+                    'country', COALESCE(country_of_origin, ''),
+                    'type', COALESCE(category_style, ''),
+                    'region', COALESCE(region, ''),
+                    'distillery', COALESCE(distillery, ''),
+                    'age', COALESCE(age, ''),
+                    'purchaseDate', to_char(purchased_approx, 'FMMM/FMDD/YYYY'),
+                    'abv', COALESCE(abv, 0),
+                    'size', COALESCE(volume, ''),
+                    'purchasePrice', COALESCE(price_cost, 0),
+                    'status', COALESCE(opened_closed, ''),
+                    'batch', COALESCE(errata, ''),
+                    'notes', '',
+                    'currentValue', COALESCE(replacement_cost, price_cost, 0),
+                    'replacementCost', replacement_cost
+                )
+                FROM liquor
+                ORDER BY name
+            """)
+
+            print("\nStep 3: Generating TypeScript file...")
+
+            # Write to file
+            # If OUTPUT_FILE is absolute, use it directly; otherwise make it relative to script dir
+            if os.path.isabs(OUTPUT_FILE):
+                output_path = OUTPUT_FILE
+            else:
+                output_path = os.path.join(os.path.dirname(__file__), OUTPUT_FILE)
+
+            # Write next to the target and swap it in at the end, so a failed
+            # export never leaves a half-written data file behind
+            tmp_path = f"{output_path}.tmp"
+            record_count = 0
+
+            with open(tmp_path, 'wb') as f:
+                f.write(
+                    b"import { WhiskeyBottle } from '@/types/whiskey';\n"
+                    b"\n"
+                    b"export const whiskeyCollection: WhiskeyBottle[] = ["
+                )
+
+                # Each json value is decoded into a dict
+                for (bottle,) in cur:
+                    # replacementCost is optional in WhiskeyBottle, so omit it when unset
+                    if bottle['replacementCost'] is None:
+                        del bottle['replacementCost']
+
+                    # A JSON array is a valid TypeScript array literal; orjson
+                    # writes UTF-8 bytes with the same layout as json.dumps(indent=2)
+                    record = orjson.dumps(bottle, option=orjson.OPT_INDENT_2)
+                    f.write(b",\n  " if record_count else b"\n  ")
+                    f.write(record.replace(b"\n", b"\n  "))
+                    record_count += 1
+
+                f.write(b"\n];\n" if record_count else b"];\n")
+
+            os.replace(tmp_path, output_path)
+
+            print(f"\n✓ Successfully exported to {OUTPUT_FILE}")
+            print(f"  Total records: {record_count:,}")
 
         print("\n" + "=" * 60)
         print("Export completed successfully!")
@@ -0,0 +1,117 @@
+"""
+Parsing helpers shared by the CSV import and the Google Sheets sync
+Turns spreadsheet CSV lines into rows in liquor table column order
+"""
+
+import csv
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice, repeat, zip_longest
+
+# Cell values treated as empty; one hash lookup instead of three comparisons
+EMPTY_VALUES = frozenset(('', '-', None))
+
+# Date formats to try, most common in the spreadsheet first
+DATE_FORMATS = ('%m/%d/%Y', '%Y-%m-%d', '%m/%d/%y', '%d/%m/%Y')
+
+# Translation table that strips dollar signs and commas from prices
+NUMERIC_STRIP = str.maketrans('', '', '$,')
+
+def parse_value(value):
+    """Parse a value from CSV, returning None for empty strings"""
+    if value in EMPTY_VALUES:
+        return None
+    return value
+
+@lru_cache(maxsize=4096)
+def parse_numeric(value):
+    """Parse numeric value, handling empty strings, dollar signs, and commas"""
+    if value in EMPTY_VALUES:
+        return None
+    # Remove dollar signs and commas
+    cleaned = value.translate(NUMERIC_STRIP).strip()
+    try:
+        return float(cleaned)
+    except (ValueError, TypeError):
+        return None
+
+@lru_cache(maxsize=1024)
+def parse_integer(value):
+    """Parse integer value, handling empty strings"""
+    if value in EMPTY_VALUES:
+        return None
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+@lru_cache(maxsize=8192)
+def parse_date(value):
+    """Parse date value, handling various formats
+
+    Results are cached since purchase dates repeat across many rows.
+    """
+    if value in EMPTY_VALUES:
+        return None
+
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except (ValueError, TypeError):
+            continue
+
+    return None
+
+# Spreadsheet columns and their parsers, in liquor table column order
+CSV_COLUMNS = (
+    ('name', parse_value),
+    ('count', parse_integer),
+    ('Country of Origin', parse_value),
+    ('category/style', parse_value),
+    ('region', parse_value),
+    ('distillery', parse_value),
+    ('age', parse_value),
+    ('purchased approx', parse_date),
+    ('ABV', parse_numeric),
+    ('volume', parse_value),
+    ('price (cost)', parse_numeric),
+    ('Opened/Closed', parse_value),
+    ('errata', parse_value),
+    ('Replacement Cost', parse_numeric),
+)
+
+# Columns that may be missing from older copies of the spreadsheet
+OPTIONAL_COLUMNS = {'Replacement Cost'}
+
+# Number of CSV rows parsed together, column by column
+PARSE_BATCH_SIZE = 1000
+
+def parse_rows(lines):
+    """Yield database rows parsed from CSV lines, skipping rows with no name
+
+    Rows are parsed a batch at a time and one column at a time, so the
+    per-field work runs inside map() and zip() rather than a Python loop.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, [])
+
+    # Resolve column positions once instead of building a dict per row
+    columns = []
+    for column, parser in CSV_COLUMNS:
+        if column in header:
+            columns.append((header.index(column), parser))
+        elif column in OPTIONAL_COLUMNS:
+            columns.append((None, parser))
+        else:
+            raise KeyError(column)
+
+    for batch in iter(lambda: list(islice(reader, PARSE_BATCH_SIZE)), []):
+        # Transpose to columns; the header pads short rows with empty strings
+        fields = list(zip_longest(header, *batch, fillvalue=''))
+        parsed = [
+            map(parser, fields[position][1:]) if position is not None else repeat(None)
+            for position, parser in columns
+        ]
+
+        # Skip rows with no name (empty rows)
+        yield from (record for record in zip(*parsed) if record[0])
@@ -1,89 +1,37 @@
 #!/usr/bin/env python3
 """
 Sync liquor database with Google Sheets
-Downloads latest CSV from Google Sheets and updates the database
+Streams the latest CSV from Google Sheets straight into the database
 """
 
+import codecs
 import csv
 import psycopg2
-from psycopg2.extras import execute_values
+import psycopg2.errors
 import sys
-import os
+import tempfile
 import urllib.request
 import urllib.error
-from datetime import datetime
+
+from db import get_connection
+from liquor_parse import parse_rows
 
 # Google Sheets configuration
 SPREADSHEET_ID = '1plsSjVwRABsIbpjZGsxBXWpLV4hAGPRTFFlJOV4guFk'
 SHEET_ID = '0'
-CSV_FILE = 'Liquor - Sheet1.csv'
-
-# Database configuration
-DB_CONFIG = {
-    'dbname': os.environ.get('DB_NAME', 'liquor_db'),
-    'user': os.environ.get('DB_USER', 'jonny'),
-    'password': os.environ.get('DB_PASSWORD', ''),
-    'host': os.environ.get('DB_HOST', 'localhost'),
-    'port': os.environ.get('DB_PORT', '5432')
-}
-
-def parse_value(value):
-    """Parse a value from CSV, returning None for empty strings"""
-    if value == '' or value is None or value == '-':
-        return None
-    return value
-
-def parse_numeric(value):
-    """Parse numeric value, handling empty strings, dollar signs, and commas"""
-    if value == '' or value is None or value == '-':
-        return None
-    # Remove dollar signs and commas
-    cleaned = value.replace('$', '').replace(',', '').strip()
-    try:
-        return float(cleaned)
-    except (ValueError, TypeError):
-        return None
-
-def parse_integer(value):
-    """Parse integer value, handling empty strings"""
-    if value == '' or value is None or value == '-':
-        return None
-    try:
-        return int(value)
-    except (ValueError, TypeError):
-        return None
-
-def parse_date(value):
-    """Parse date value, handling various formats"""
-    if value == '' or value is None or value == '-':
-        return None
-
-    # Try various date formats
-    formats = ['%m/%d/%Y', '%Y-%m-%d', '%m/%d/%y', '%d/%m/%Y']
-
-    for fmt in formats:
-        try:
-            return datetime.strptime(value, fmt).date()
-        except (ValueError, TypeError):
-            continue
-
-    return None
+SHEET_URL = f'https://docs.google.com/spreadsheets/d/{SPREADSHEET_ID}/export?format=csv&gid={SHEET_ID}'
 
-def download_from_google_sheets():
-    """Download Google Sheet as CSV"""
-    url = f'https://docs.google.com/spreadsheets/d/{SPREADSHEET_ID}/export?format=csv&gid={SHEET_ID}'
+# Parsed rows are buffered in memory up to this size before spilling to disk
+SPOOL_MAX_SIZE = 64 * 1024 * 1024
 
+def open_google_sheet():
+    """Open the Google Sheet CSV export as a streaming response"""
     print("Step 1: Downloading latest data from Google Sheets...")
 
     try:
-        with urllib.request.urlopen(url) as response:
-            csv_data = response.read()
-
-        with open(CSV_FILE, 'wb') as f:
-            f.write(csv_data)
-
-        print(f"✓ Downloaded {CSV_FILE}")
-        return True
+        response = urllib.request.urlopen(SHEET_URL)
+        print("✓ Connected to Google Sheets export")
+        return response
 
     except urllib.error.HTTPError as e:
         if e.code == 404:
@@ -91,100 +39,172 @@ def download_from_google_sheets():
             print("Make sure the spreadsheet is shared with 'Anyone with the link can view'")
         else:
             print(f"HTTP Error {e.code}: {e.reason}")
-        return False
+        return None
 
     except Exception as e:
         print(f"Error downloading spreadsheet: {e}")
-        return False
+        return None
 
-def sync_to_database():
-    """Sync CSV data to PostgreSQL database"""
+def sync_to_database(lines):
+    """Sync CSV data to PostgreSQL database
 
-    print(f"\nStep 2: Connecting to database...")
+    `lines` is any iterable of CSV text lines, such as the decoded Google
+    Sheets response or an open CSV file.
+
+    Statements are grouped so the sync takes four round-trips plus the
+    commit: set up the stage table, COPY into it, check it for duplicate
+    names, then merge.
+    """
+
+    print(f"\nStep 2: Reading CSV data...")
 
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-
-        # Get current count before sync
-        cur.execute("SELECT COUNT(*) FROM liquor")
-        old_count = cur.fetchone()[0]
-
-        print(f"Current database records: {old_count:,}")
-        print(f"\nStep 3: Reading CSV file...")
-
-        # Read CSV file
-        with open(CSV_FILE, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-
-            data = []
-            for row in reader:
-                # Skip rows with no name (empty rows)
-                name = parse_value(row['name'])
-                if not name:
-                    continue
-
-                data.append((
-                    name,
-                    parse_integer(row['count']),
-                    parse_value(row['Country of Origin']),
-                    parse_value(row['category/style']),
-                    parse_value(row['region']),
-                    parse_value(row['distillery']),
-                    parse_value(row['age']),
-                    parse_date(row['purchased approx']),
-                    parse_numeric(row['ABV']),
-                    parse_value(row['volume']),
-                    parse_numeric(row['price (cost)']),
-                    parse_value(row['Opened/Closed']),
-                    parse_value(row['errata']),
-                    parse_numeric(row.get('Replacement Cost'))
-                ))
-
-        print(f"CSV records to import: {len(data):,}")
-
-        print(f"\nStep 4: Syncing database...")
-        print("  - Clearing old data...")
-
-        # Clear existing data
-        cur.execute("TRUNCATE TABLE liquor RESTART IDENTITY")
-
-        print("  - Inserting new data...")
-
-        # Batch insert new data
-        insert_query = """
-            INSERT INTO liquor (
-                name, count, country_of_origin, category_style, region, distillery,
-                age, purchased_approx, abv, volume, price_cost, opened_closed,
-                errata, replacement_cost
-            ) VALUES %s
-        """
-
-        execute_values(cur, insert_query, data)
-
-        # Commit transaction
-        conn.commit()
-
-        # Get new count
-        cur.execute("SELECT COUNT(*) FROM liquor")
-        new_count = cur.fetchone()[0]
+        # Spool parsed rows in COPY format before connecting, so the download
+        # finishes first; stays in memory unless the sheet is very large
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+',
+                                           newline='', encoding='utf-8') as buf:
+            writer = csv.writer(buf, quoting=csv.QUOTE_MINIMAL)
+            record_count = 0
+            for record in parse_rows(lines):
+                writer.writerow(record)
+                record_count += 1
+
+            print(f"CSV records to import: {record_count:,}")
+
+            print(f"\nStep 3: Connecting to database...")
+
+            with get_connection() as conn, conn.cursor() as cur:
+                # The data is reloadable from the sheet, so don't wait for the
+                # WAL flush when this bulk-load transaction commits.
+                # Load into a temporary copy of the table, then merge only the
+                # differences into liquor so unchanged rows are never rewritten.
+                cur.execute("""
+                    SET LOCAL synchronous_commit = off;
+
+                    CREATE TEMP TABLE liquor_stage ON COMMIT DROP AS
+                    SELECT
+                        name, count, country_of_origin, category_style, region, distillery,
+                        age, purchased_approx, abv, volume, price_cost, opened_closed,
+                        errata, replacement_cost
+                    FROM liquor WITH NO DATA;
+
+                    SELECT COUNT(*) FROM liquor;
+                """)
+                old_count = cur.fetchone()[0]
+
+                print(f"Current database records: {old_count:,}")
+
+                print(f"\nStep 4: Syncing database...")
+                print("  - Staging new data...")
+
+                copy_query = """
+                    COPY liquor_stage (
+                        name, count, country_of_origin, category_style, region, distillery,
+                        age, purchased_approx, abv, volume, price_cost, opened_closed,
+                        errata, replacement_cost
+                    ) FROM STDIN WITH (FORMAT CSV, NULL '')
+                """
+
+                buf.seek(0)
+                cur.copy_expert(copy_query, buf)
+
+                # Rows are keyed on name (unique index idx_liquor_name), so a
+                # name listed twice in the sheet can't be synced
+                cur.execute("""
+                    SELECT name
+                    FROM liquor_stage
+                    GROUP BY name
+                    HAVING COUNT(*) > 1
+                    ORDER BY name
+                """)
+                duplicates = [row[0] for row in cur.fetchall()]
+                if duplicates:
+                    print("Error: Bottle names must be unique; duplicated in the sheet:")
+                    for name in duplicates:
+                        print(f"  - {name}")
+                    return False
+
+                print("  - Merging changes...")
+
+                # Rows whose values are unchanged are skipped, so they keep
+                # their updated_at.
+                # Bottles no longer in the sheet are removed in the same
+                # statement; the two sets of rows never overlap.
+                cur.execute("""
+                    WITH upserted AS (
+                        INSERT INTO liquor (
+                            name, count, country_of_origin, category_style, region, distillery,
+                            age, purchased_approx, abv, volume, price_cost, opened_closed,
+                            errata, replacement_cost
+                        )
+                        SELECT * FROM liquor_stage
+                        ON CONFLICT (name) DO UPDATE SET
+                            count = EXCLUDED.count,
+                            country_of_origin = EXCLUDED.country_of_origin,
+                            category_style = EXCLUDED.category_style,
+                            region = EXCLUDED.region,
+                            distillery = EXCLUDED.distillery,
+                            age = EXCLUDED.age,
+                            purchased_approx = EXCLUDED.purchased_approx,
+                            abv = EXCLUDED.abv,
+                            volume = EXCLUDED.volume,
+                            price_cost = EXCLUDED.price_cost,
+                            opened_closed = EXCLUDED.opened_closed,
+                            errata = EXCLUDED.errata,
+                            replacement_cost = EXCLUDED.replacement_cost
+                        WHERE (
+                            liquor.count, liquor.country_of_origin, liquor.category_style,
+                            liquor.region, liquor.distillery, liquor.age, liquor.purchased_approx,
+                            liquor.abv, liquor.volume, liquor.price_cost, liquor.opened_closed,
+                            liquor.errata, liquor.replacement_cost
+                        ) IS DISTINCT FROM (
+                            EXCLUDED.count, EXCLUDED.country_of_origin, EXCLUDED.category_style,
+                            EXCLUDED.region, EXCLUDED.distillery, EXCLUDED.age, EXCLUDED.purchased_approx,
+                            EXCLUDED.abv, EXCLUDED.volume, EXCLUDED.price_cost, EXCLUDED.opened_closed,
+                            EXCLUDED.errata, EXCLUDED.replacement_cost
+                        )
+                        -- xmax is 0 only for freshly inserted rows
+                        RETURNING (xmax = 0) AS inserted
+                    ),
+                    removed AS (
+                        DELETE FROM liquor
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM liquor_stage WHERE liquor_stage.name = liquor.name
+                        )
+                        RETURNING 1
+                    )
+                    SELECT
+                        (SELECT COUNT(*) FILTER (WHERE inserted) FROM upserted),
+                        (SELECT COUNT(*) FILTER (WHERE NOT inserted) FROM upserted),
+                        (SELECT COUNT(*) FROM removed)
+                """)
+                added_count, updated_count, removed_count = cur.fetchone()
+
+                # Commit transaction
+                conn.commit()
+
+        new_count = old_count + added_count - removed_count
 
         print(f"\n✓ Sync complete!")
         print(f"  Old records: {old_count:,}")
         print(f"  New records: {new_count:,}")
         print(f"  Difference: {new_count - old_count:+,}")
-
-        cur.close()
-        conn.close()
+        print(f"  Added: {added_count:,}")
+        print(f"  Updated: {updated_count:,}")
+        print(f"  Removed: {removed_count:,}")
 
         return True
 
-    except psycopg2.Error as e:
+    except psycopg2.errors.InvalidColumnReference as e:
+        # ON CONFLICT (name) needs a unique index on name
         print(f"Database error: {e}")
+        print("The liquor table has no unique index on name. Rebuild it once with:")
+        print("  DROP INDEX idx_liquor_name;")
+        print("  CREATE UNIQUE INDEX idx_liquor_name ON liquor(name);")
         return False
 
-    except FileNotFoundError:
-        print(f"Error: CSV file '{CSV_FILE}' not found")
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
         return False
 
     except Exception as e:
@@ -197,13 +217,17 @@ def main():
     print("Liquor Database Sync")
     print("=" * 60)
 
-    # Download latest data
-    if not download_from_google_sheets():
+    # Open the latest data from Google Sheets
+    response = open_google_sheet()
+    if response is None:
         print("\n✗ Sync failed: Could not download from Google Sheets")
         sys.exit(1)
 
-    # Sync to database
-    if not sync_to_database():
+    # Stream it straight into the database
+    with response:
+        synced = sync_to_database(codecs.iterdecode(response, 'utf-8'))
+
+    if not synced:
         print("\n✗ Sync failed: Could not update database")
         sys.exit(1)
 
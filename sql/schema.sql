@@ -24,7 +24,9 @@ CREATE TABLE liquor (
 );
 
 -- Create indexes for common queries
-CREATE INDEX idx_liquor_name ON liquor(name);
+-- name is unique: sync_from_sheets.py upserts on it (ON CONFLICT (name)),
+-- and export_to_typescript.py streams rows in name order from it
+CREATE UNIQUE INDEX idx_liquor_name ON liquor(name);
 CREATE INDEX idx_liquor_distillery ON liquor(distillery);
 CREATE INDEX idx_liquor_category ON liquor(category_style);
 CREATE INDEX idx_liquor_country ON liquor(country_of_origin);